@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 from argparse import ArgumentParser, Namespace
+from concurrent.futures import as_completed
+from contextlib import redirect_stdout
+from io import StringIO
+from json import dump
 from pathlib import Path
-from re import search
-from sys import argv
-from typing import Callable, Iterable, List, Optional, TextIO, Tuple
-from urllib.request import urlopen, urlretrieve
+from shutil import copytree, rmtree
+from sys import argv, stderr, stdout
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
 from ports import Platform, PortError, PortLicense, Ports
-from ports.cran import Cran, CranPort
+from ports.core.distinfo import read_distinfo
+from ports.cran import ConnectionPool, Cran, CranIndex, CranMetadata, CranPort, DependencyGraph, Fetcher
 
 
 __author__ = "David Naylor <dbn@FreeBSD.org>"
@@ -19,6 +23,12 @@ ERR_GENERAL = 1
 ERR_CATEGORY = 2
 ERR_EXISTS = 3
 
+POOL = ConnectionPool()
+
+CRAN = CranIndex(pool=POOL)
+
+FETCHER = Fetcher(CRAN)
+
 
 class Command(object):
     def __init__(self, description: str) -> None:
@@ -46,15 +56,198 @@ class Command(object):
 def make_cran_port(name: str, portdir: Optional[Path] = None, version: Optional[str] = None) -> CranPort:
     if not version:
         print("Checking for latest version...")
-        site_page = urlopen("http://cran.r-project.org/package=%s" % name).read().decode("utf-8")
-        version_match = search(r"<td>Version:</td>\s*<td>(.*?)</td>", str(site_page))
-        assert version_match is not None
-        version = version_match.group(1)
-    distfile = Ports.distdir / ("%s_%s.tar.gz" % (name, version))
-    if not distfile.exists():  # pylint: disable=no-member
+        version = CRAN.version(name)
+    if not FETCHER.distfile(name, version).exists():
         print("Fetching package source (%s-%s)..." % (name, version))
-        urlretrieve("https://cran.r-project.org/src/contrib/%s" % distfile.name, distfile)  # pylint: disable=no-member
-    return CranPort.create(name, distfile, portdir)
+    return CranPort.create(name, FETCHER.fetch(name, version), portdir)
+
+
+def load_changelog(port: CranPort) -> Dict[str, List[str]]:
+    """
+    Return the changelog of the CRAN package of an existing port.
+
+    The changelog is taken from the metadata cached for the distfile listed in the port's distinfo, falling back to
+    (fetching and) parsing the distfile.
+    """
+    assert port.portname is not None
+    distfile = "%s_%s.tar.gz" % (port.portname, port.version)
+    checksum = read_distinfo(port.portdir / "distinfo").get(distfile)
+    if checksum is not None:
+        metadata = CranMetadata.lookup(port.portname, checksum, port.version)
+        if metadata is not None:
+            return metadata.changelog
+    cran = make_cran_port(port.portname, version=port.version)
+    assert cran.version == port.version
+    return cran.changelog
+
+
+def has_port(name: str) -> bool:
+    try:
+        return Ports.find_port_by_name(Cran.PKGNAMEPREFIX + name) is not None
+    except PortError:
+        return False
+
+
+def find_missing(name: str) -> List[str]:
+    """
+    Return the CRAN package and the packages it requires, directly or indirectly, that do not have a port.
+
+    The packages are ordered such that each package comes after the packages it requires.
+    """
+    graph = DependencyGraph()
+    missing = set()
+    pending = [name]
+    while pending:
+        package = pending.pop()
+        if package not in missing:
+            missing.add(package)
+            graph.add_index(CRAN, [package], ("build", "run"))
+            pending.extend(i for i in graph.depends(package) if not has_port(i))
+    return graph.order(missing)
+
+
+def create_ports(names: List[str], portsdir: Path, categories: List[str]) -> Iterator[CranPort]:
+    """
+    Create a port, in the specified categories, for each of the CRAN packages, yielding each port once generated.
+
+    All distfiles are downloaded concurrently while the ports are generated in the specified order.  Each generated
+    port is added to the ports collection, so the packages must be ordered such that required packages come first.
+    """
+    futures = FETCHER.submit_all({i: CRAN.version(i) for i in names})
+    for name in names:
+        portdir = portsdir / categories[0] / (Cran.PKGNAMEPREFIX + name)
+        if not futures[name].done():
+            print("Fetching package source (%s-%s)..." % (name, CRAN.version(name)))
+        cran = CranPort.create(name, futures[name].result(), portdir)
+        cran.category = categories[0]
+        cran.categories = categories
+        cran.maintainer = Platform.address
+        portdir.mkdir()
+        cran.generate()
+        Ports.register(cran)
+        yield cran
+
+
+def find_outdated() -> List[Tuple[str, str, str, str]]:
+    """
+    Return the origin, CRAN package name, port version and latest CRAN version of each outdated CRAN port.
+
+    Only the name and version variables are read from each port's Makefile, the ports are not loaded.  Ports whose
+    name and version cannot be read are reported and skipped.
+    """
+    outdated = []
+    for port in Ports.find_ports(Cran.PKGNAMEPREFIX):
+        try:
+            name, version = CranPort.read_version(port)
+        except PortError as ex:
+            print("Skipping %s: %s" % (port.origin, ex))
+            continue
+        if name in CRAN and CRAN.version(name) != version:
+            outdated.append((port.origin, name, version, CRAN.version(name)))
+    return outdated
+
+
+def update_ports(names: List[str], output: Optional[Path]) -> Dict[str, Tuple[bool, str]]:
+    """
+    Update the specified CRAN ports, returning if each update succeeded and a description of the outcome.
+
+    Every port is loaded, then all distfiles are downloaded concurrently while each port is generated as soon as its
+    distfile is available.  The output directory, if specified, is the port directory for a single port and is
+    otherwise used as a ports directory.
+
+    A port directory is only replaced once the port and its update log have been generated.  The update logs are
+    written to commit.svn in the output directory, or the ports directory if no output directory is specified.
+    """
+    results: Dict[str, Tuple[bool, str]] = {}
+    ports: Dict[str, CranPort] = {}
+    versions: Dict[str, str] = {}
+    for name in names:
+        try:
+            port = Ports.get_port_by_name(Cran.PKGNAMEPREFIX + name)
+            if not isinstance(port, CranPort):
+                raise PortError("CRAN: %s is not a CRAN port" % port.origin)
+            version = CRAN.version(name)
+        except PortError as ex:
+            results[name] = (False, str(ex))
+            continue
+        if version == port.version:
+            results[name] = (True, "already at version %s" % version)
+            continue
+        ports[name] = port
+        versions[name] = version
+    logs: List[str] = []
+    futures = {j: i for i, j in FETCHER.submit_all(versions).items()}
+    for future in as_completed(futures):
+        name = futures[future]
+        port = ports[name]
+        if output is None:
+            portdir = port.portdir
+        elif len(names) == 1:
+            portdir = output
+        else:
+            portdir = output / port.category / port.name
+        try:
+            print("Updating %s to version %s..." % (port.origin, versions[name]))
+            log = update_port(port, future.result(), portdir)
+        except Exception as ex:  # pylint: disable=broad-except
+            results[name] = (False, str(ex))
+        else:
+            logs.append(log)
+            results[name] = (True, "updated to version %s" % versions[name])
+    if logs:
+        write_log(Ports.dir if output is None else output, logs)
+    return results
+
+
+def update_port(port: CranPort, distfile: Path, portdir: Path) -> str:
+    """
+    Generate the updated port from the CRAN package's source, replacing the port directory, and return the update log.
+
+    The port is generated in a copy of the port directory, which only replaces the port directory once complete.
+    """
+    assert port.portname is not None
+    workdir = portdir.with_name(".%s.portcran" % portdir.name)
+    try:
+        stage_port(portdir, workdir)
+        cran = CranPort.create(port.portname, distfile, workdir)
+        changelog = load_changelog(port) if cran.version in cran.changelog else {}
+        cran.generate()
+        log = StringIO()
+        generate_update_log(port, cran, changelog, log)
+        replace_port(workdir, portdir)
+    finally:
+        if workdir.exists():
+            rmtree(str(workdir))
+    return log.getvalue()
+
+
+def write_log(logdir: Path, logs: List[str]) -> None:
+    """Write the update logs to commit.svn in the specified directory."""
+    with open(logdir / "commit.svn", "w", encoding="utf-8") as log_file:
+        log_file.write("\n".join(logs))
+
+
+def stage_port(portdir: Path, workdir: Path) -> None:
+    """Prepare the directory to generate a port in, starting with a copy of the existing port (if any)."""
+    if workdir.exists():
+        rmtree(str(workdir))
+    if portdir.exists():
+        copytree(str(portdir), str(workdir))
+    else:
+        workdir.mkdir(parents=True)
+
+
+def replace_port(workdir: Path, portdir: Path) -> None:
+    """Replace the port directory with the directory the port was generated in."""
+    if portdir.exists():
+        backup = portdir.with_name(".%s.old" % portdir.name)
+        if backup.exists():
+            rmtree(str(backup))
+        portdir.rename(backup)
+        workdir.rename(portdir)
+        rmtree(str(backup))
+    else:
+        workdir.rename(portdir)
 
 
 def diff(left: Iterable[str], right: Iterable[str]) -> Tuple[List[str], bool, List[str]]:
@@ -115,101 +308,125 @@ def log_license(log: TextIO, old: PortLicense, new: PortLicense) -> None:
             log.write(" - update license combination\n")
 
 
-def generate_update_log(old: CranPort, new: CranPort) -> None:
+def generate_update_log(old: CranPort, new: CranPort, changelog: Dict[str, List[str]], log: TextIO) -> None:
     assert (old.portversion or old.distversion) != new.distversion
-    with open(new.portdir / "commit.svn", "w", encoding="utf-8") as log:
-        log.write("%s: updated to version %s\n\n" % (new.origin, new.distversion))
-        if old.portrevision is not None:
-            log.write(" - removed PORTREVISION due to version bump\n")
-
-        if old.maintainer != new.maintainer:
-            log.write(" - update maintainer\n")
-        if old.comment != new.comment:
-            log.write(" - updated comment to align with CRAN package\n")
-
-        if list(sorted(old.license)) != list(sorted(new.license)) or old.license.combination != new.license.combination:
-            log.write(" - updated license to align with CRAN package\n")
-        if old.license.file is None and new.license.file is not None:
-            log.write(" - added license file from CRAN package\n")
-        elif old.license.file is not None and new.license.file is None:
-            log.write(" - removed license file (no longer in CRAN package)\n")
-
-        for depend in ("build", "lib", "run", "test"):
-            old_depends = getattr(old.depends, depend)
-            new_depends = getattr(new.depends, depend)
-            log_depends(log, depend, diff([i.origin for i in old_depends], sorted(i.origin for i in new_depends)))
-
-        if old.description != new.description:
-            log.write(" - update description to align with CRAN package\n")
-        if old.website != new.website:
-            log.write(" - update website URL to align with CRAN package\n")
-
-        if new.version in new.changelog:
-            assert old.portname is not None
-            port = make_cran_port(old.portname, version=old.version)
-            assert port.version == old.version
-            if port.version in port.changelog and port.changelog[port.version] == new.changelog[new.version]:
-                log.write(" - changelog not updated\n")
-            else:
-                log.write(" - changelog:\n")
-                for line in new.changelog[new.version]:
-                    log.write("   -")
-                    length = 4
-                    for word in line.split(" "):
-                        length += len(word) + 1
-                        if length > 75:
-                            log.write("\n    ")
-                            length = 5 + len(word)
-                        log.write(" " + word)
-                    log.write("\n")
+    log.write("%s: updated to version %s\n\n" % (new.origin, new.distversion))
+    if old.portrevision is not None:
+        log.write(" - removed PORTREVISION due to version bump\n")
+
+    if old.maintainer != new.maintainer:
+        log.write(" - update maintainer\n")
+    if old.comment != new.comment:
+        log.write(" - updated comment to align with CRAN package\n")
+
+    if list(sorted(old.license)) != list(sorted(new.license)) or old.license.combination != new.license.combination:
+        log.write(" - updated license to align with CRAN package\n")
+    if old.license.file is None and new.license.file is not None:
+        log.write(" - added license file from CRAN package\n")
+    elif old.license.file is not None and new.license.file is None:
+        log.write(" - removed license file (no longer in CRAN package)\n")
+
+    for depend in ("build", "lib", "run", "test"):
+        old_depends = getattr(old.depends, depend)
+        new_depends = getattr(new.depends, depend)
+        log_depends(log, depend, diff([i.origin for i in old_depends], sorted(i.origin for i in new_depends)))
+
+    if old.description != new.description:
+        log.write(" - update description to align with CRAN package\n")
+    if old.website != new.website:
+        log.write(" - update website URL to align with CRAN package\n")
+
+    if new.version in new.changelog:
+        if old.version in changelog and changelog[old.version] == new.changelog[new.version]:
+            log.write(" - changelog not updated\n")
         else:
-            log.write(" - no changelog provided\n")
-
-        log.write("\nGenerated by:\tportcran (%s)\n" % __version__)
-
-
-def update_category(portsdir: Path, category: str, name: str) -> None:
-    entry = "    SUBDIR += %s\n" % name
+            log.write(" - changelog:\n")
+            for line in new.changelog[new.version]:
+                log.write("   -")
+                length = 4
+                for word in line.split(" "):
+                    length += len(word) + 1
+                    if length > 75:
+                        log.write("\n    ")
+                        length = 5 + len(word)
+                    log.write(" " + word)
+                log.write("\n")
+    else:
+        log.write(" - no changelog provided\n")
+
+    log.write("\nGenerated by:\tportcran (%s)\n" % __version__)
+
+
+def update_category(portsdir: Path, category: str, names: Iterable[str]) -> None:
+    entries = sorted(set("    SUBDIR += %s\n" % i for i in names))
     makefile = portsdir / category / "Makefile"
     tmpfile = portsdir / category / ".Makefile.portcran"
     with makefile.open() as old:
         with tmpfile.open("w") as new:
             has_subdir = False
-            drain = False
             for line in old.readlines():
-                if not drain:
-                    if line == entry:
-                        drain = True
-                    if line.lstrip().startswith("SUBDIR"):
-                        has_subdir = True
-                        if line > entry:
-                            new.write(entry)
-                            drain = True
-                    elif has_subdir:
-                        new.write(entry)
-                        drain = True
+                if line in entries:
+                    entries.remove(line)
+                if line.lstrip().startswith("SUBDIR"):
+                    has_subdir = True
+                    while entries and line > entries[0]:
+                        new.write(entries.pop(0))
+                elif has_subdir:
+                    new.writelines(entries)
+                    entries = []
                 new.write(line)
     tmpfile.rename(makefile)
 
 
-def generate_create_log(cran: CranPort) -> None:
+def generate_create_log(cran: CranPort, depends: Sequence[CranPort] = ()) -> None:
     with open(cran.portdir / ".." / ".." / "commit.svn", "w") as log:
         log.write("%s: %s\n" % (cran.origin, cran.comment))
+        if depends:
+            log.write("\n - with new dependenc%s:\n" % yies(list(depends)))
+            for port in depends:
+                log.write("   - %s: %s\n" % (port.origin, port.comment))
         log.write("\nGenerated by:\tportcran (%s)\n" % __version__)
 
 
 def main() -> None:
+    # pylint: disable=too-many-statements
     command = Command(__summary__)
 
-    @command("update", "update a CRAN port")
+    @command("update", "update CRAN ports")
     def update(args: Namespace) -> None:
-        port = Ports.get_port_by_name(Cran.PKGNAMEPREFIX + args.name)
-        assert isinstance(port, CranPort)
-        cran = make_cran_port(args.name, portdir=Path(args.output))
-        cran.generate()
-        generate_update_log(port, cran)
-    update.add_argument("name", help="name of the CRAN package")
-    update.add_argument("-o", "--output", help="output directory")
+        FETCHER.jobs = args.jobs
+        names = list(args.names)
+        if not names and not args.all_outdated:
+            print("err: no CRAN packages to update")
+            exit(ERR_GENERAL)
+        if args.all_outdated:
+            names.extend(i[1] for i in find_outdated() if i[1] not in names)
+            if not names:
+                print("All CRAN ports are up to date")
+                return
+        results = update_ports(names, None if args.output is None else Path(args.output))
+        print("Summary:")
+        for name in names:
+            print("\t%s: %s" % (name, results[name][1].replace("\n", "\n\t\t")))
+        if not all(results[i][0] for i in names):
+            exit(ERR_GENERAL)
+    update.add_argument("names", nargs="*", metavar="name", help="name of the CRAN package")
+    update.add_argument("-j", "--jobs", type=int, help="number of concurrent downloads")
+    update.add_argument("-o", "--output", help="output directory (a ports directory if updating multiple ports)")
+    update.add_argument("--all-outdated", action="store_true", help="update all CRAN ports with a newer version")
+
+    @command("outdated", "list CRAN ports with a newer version available")
+    def outdated(args: Namespace) -> None:
+        with redirect_stdout(stderr):
+            ports = find_outdated()
+        if args.json:
+            keys = ("origin", "name", "version", "latest")
+            dump([dict(zip(keys, i)) for i in ports], stdout, indent=2)
+            stdout.write("\n")
+        else:
+            for port in ports:
+                print("\t".join(port))
+    outdated.add_argument("--json", action="store_true", help="output as JSON instead of tab separated values")
 
     @command("create", "create a CRAN port")
     def create(args: Namespace) -> None:
@@ -221,26 +438,29 @@ def main() -> None:
                 print("err: %s in not a ports category" % category)
                 exit(ERR_CATEGORY)
         portsdir = Ports.dir if args.portsdir is None else Path(args.portsdir)
-        category = categories[0]
-        name = Cran.PKGNAMEPREFIX + args.name
-        portdir = portsdir / category / name
-        cran = make_cran_port(args.name, portdir)
-        cran.categories = categories
-        cran.maintainer = Platform.address
         try:
-            port = Ports.get_port_by_name(name)
+            port = Ports.get_port_by_name(Cran.PKGNAMEPREFIX + args.name)
             print("err: CRAN port %s already exists at %s" % (args.name, port.origin))
             exit(ERR_EXISTS)
         except PortError:
             pass
-        portdir.mkdir()
-        update_category(portsdir, category, name)
-        cran.generate()
-        generate_create_log(cran)
+        names = find_missing(args.name) if args.recursive else [args.name]
+        if len(names) > 1:
+            print("Creating ports for missing dependencies: %s" % ", ".join(names[:-1]))
+        ports: List[CranPort] = []
+        try:
+            for port in create_ports(names, portsdir, categories):
+                ports.append(port)
+        finally:
+            if ports:
+                update_category(portsdir, categories[0], (i.name for i in ports))
+        generate_create_log(ports[-1], ports[:-1])
     create.add_argument("name", help="name of the CRAN package")
     create.add_argument("-a", "--address", help="creator's email address")
     create.add_argument("-c", "--categories", default="math", help="comma separated list of the CRAN port's categories")
     create.add_argument("-p", "--portsdir", help="output ports directory")
+    create.add_argument("-r", "--recursive", action="store_true",
+                        help="also create ports for required CRAN packages that do not have a port")
 
     command.execute(argv[1:])
 
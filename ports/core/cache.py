@@ -0,0 +1,19 @@
+"""Persistent storage for data that is expensive to recompute between runs."""
+from os import environ
+from pathlib import Path
+
+__all__ = ["cache_dir"]
+
+
+def cache_dir(*parts: str) -> Path:
+    """
+    Return the cache directory, optionally joined with the specified sub-directories.
+
+    The cache directory is taken from the PORTCRAN_CACHE environment variable, falling back to "portcran" under the
+    XDG cache directory (normally ~/.cache).  The directory is not created by this function.
+    """
+    if "PORTCRAN_CACHE" in environ:
+        path = Path(environ["PORTCRAN_CACHE"])
+    else:
+        path = Path(environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "portcran"
+    return path.joinpath(*parts)
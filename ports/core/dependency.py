@@ -1,46 +1,92 @@
 """Dependency architecture for a Port."""
 from abc import ABCMeta, abstractmethod
-from typing import Callable, ClassVar, List, Optional
-from ..utilities import Orderable
+from re import compile as re_compile
+from typing import Callable, ClassVar, Dict, List, Match, Optional, Pattern, Tuple, cast
+from ..utilities import Orderable, env_flag
 
 __all__ = ["Dependency"]
 
+Factory = Callable[[Match[str], str], "Dependency"]
+
 
 class Dependency(Orderable, metaclass=ABCMeta):
-    """Base class for objects representing a dependency to a Port."""
+    """
+    Base class for objects representing a dependency to a Port.
+
+    Dependencies are immutable and are shared, using intern(), between all ports with the same dependency.
+    """
+
+    __slots__ = ("_key", "origin")
+
+    debug: ClassVar[bool] = env_flag("PORTCRAN_DEBUG")
 
-    _factories: ClassVar[List[Callable[[str, str], Optional["Dependency"]]]] = []
+    _factories: ClassVar[List[Tuple[Pattern[str], Factory]]] = []
+
+    _interned: ClassVar[Dict[str, "Dependency"]] = {}
+
+    _pattern: ClassVar[Optional[Pattern[str]]] = None
+
+    _key: str
 
     def __init__(self, origin: str) -> None:
         """Initialise the dependency with the specified port origin."""
         self.origin = origin
+        self._key = origin
+
+    def __reduce__(self) -> Tuple[Callable[[str], "Dependency"], Tuple[str]]:
+        # Unpickled dependencies are interned (i.e. those of ports loaded by another process)
+        return Dependency.create, (str(self),)
 
     @abstractmethod
     def __str__(self) -> str:
         """Return a string representation of this dependency instance."""
         raise NotImplementedError()
 
-    @property
-    def _key(self) -> str:
-        return self.origin
-
     @staticmethod
     def create(expression: str) -> "Dependency":
-        """Create an instance of a Dependency object based on the string representation."""
+        """
+        Create, or return the shared instance of, a Dependency object based on the string representation.
+
+        The target is matched against the patterns of all factories at once, using the factory registered first if
+        more than one pattern matches.  In debug mode a target matched by more than one pattern is an error.
+        """
+        dependency = Dependency._interned.get(expression)
+        if dependency is None:
+            dependency = Dependency.intern(Dependency._parse(expression))
+            Dependency._interned[expression] = dependency
+        return dependency
+
+    @staticmethod
+    def _parse(expression: str) -> "Dependency":
         target, origin = expression.split(":")
-        dependency = [i for i in (j(target, origin) for j in Dependency._factories) if i is not None]
-        if not dependency:
+        if Dependency._pattern is None:
+            patterns = ("(?P<f%d>%s)" % (i, j.pattern) for i, (j, _) in enumerate(Dependency._factories))
+            Dependency._pattern = re_compile("|".join(patterns))
+        dependency = Dependency._pattern.match(target)
+        if dependency is None:
             raise ValueError("Unknown dependency expression: %s" % expression)
-        assert len(dependency) == 1
-        return dependency[0]
+        if Dependency.debug and sum(1 for i, _ in Dependency._factories if i.match(target)) > 1:
+            raise ValueError("Ambiguous dependency expression: %s" % expression)
+        assert dependency.lastgroup is not None
+        pattern, factory = Dependency._factories[int(dependency.lastgroup[1:])]
+        return factory(cast(Match[str], pattern.match(target)), origin)
 
     @staticmethod
-    def factory(factory: Callable[[str, str], Optional["Dependency"]]) -> Callable[[str, str], Optional["Dependency"]]:
+    def factory(pattern: str) -> Callable[[Factory], Factory]:
         """
-        Decorate a function to register it as being able to create Dependency.
+        Return a decorator that registers a function as being able to create Dependency objects.
 
-        The factory function will be passed the string representation and port origin.  The function must then either
-        return an instance of a Dependency object, if it can parse the representation, or return None.
+        The function will only be passed targets (the string representation excluding the port origin) that match the
+        specified regular expression.  The function is passed the match of the pattern and the port origin and must
+        return an instance of a Dependency object.  The pattern must not refer to its groups by number.
         """
-        Dependency._factories.append(factory)
-        return factory
+        def register(factory: Factory) -> Factory:
+            Dependency._factories.append((re_compile(pattern), factory))
+            Dependency._pattern = None
+            return factory
+        return register
+
+    @staticmethod
+    def intern(dependency: "Dependency") -> "Dependency":
+        """Return the shared instance of the specified dependency, i.e. of an equivalent string representation."""
+        return Dependency._interned.setdefault(str(dependency), dependency)
@@ -0,0 +1,71 @@
+"""Generation of a port's distinfo file without make(1)."""
+from hashlib import sha256
+from re import compile as re_compile
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Dict, Iterable, Optional, Tuple
+
+__all__ = ["checksum", "read_distinfo", "record_checksum", "write_distinfo"]
+
+CHUNK_SIZE = 1 << 20
+
+SHA256_ENTRY = re_compile(r"^SHA256 \((.+)\) = (\w+)$")
+
+_checksums: Dict[Tuple[str, int, int], str] = {}
+
+_lock = Lock()
+
+
+def checksum(path: Path) -> Tuple[str, int]:
+    """
+    Return the SHA256 checksum and size of the specified file.
+
+    A checksum previously recorded for the file (with the same modification time and size) is reused, otherwise the
+    file is read in large chunks to compute the checksum.
+    """
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        digest = _checksums.get(key)
+    if digest is None:
+        hasher = sha256()
+        with path.open("rb") as data:
+            for chunk in iter(lambda: data.read(CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with _lock:
+            _checksums[key] = digest
+    return digest, stat.st_size
+
+
+def read_distinfo(distinfo: Path) -> Dict[str, str]:
+    """Return the SHA256 checksum of each distfile listed in a distinfo file, or nothing if there is no such file."""
+    checksums = {}
+    try:
+        with distinfo.open() as distinfo_file:
+            for line in distinfo_file:
+                entry = SHA256_ENTRY.match(line.strip())
+                if entry is not None:
+                    checksums[entry.group(1)] = entry.group(2)
+    except FileNotFoundError:
+        pass
+    return checksums
+
+
+def record_checksum(path: Path, digest: str) -> None:
+    """Record the already computed SHA256 checksum of the specified file, i.e. as computed while downloading it."""
+    stat = path.stat()
+    with _lock:
+        _checksums[(str(path), stat.st_mtime_ns, stat.st_size)] = digest
+
+
+def write_distinfo(distinfo: Path, distfiles: Iterable[Path], timestamp: Optional[int] = None) -> None:
+    """Write a distinfo file, in the format used by `make makesum`, for the specified distfiles."""
+    lines = ["TIMESTAMP = %d\n" % (int(time()) if timestamp is None else timestamp)]
+    for distfile in distfiles:
+        digest, size = checksum(distfile)
+        lines.append("SHA256 (%s) = %s\n" % (distfile.name, digest))
+        lines.append("SIZE (%s) = %d\n" % (distfile.name, size))
+    with distinfo.open("w") as distinfo_file:
+        distinfo_file.writelines(lines)
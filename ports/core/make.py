@@ -1,18 +1,42 @@
 """Simple representation of a bmake(1) Makefile."""
 from collections import OrderedDict
+from functools import lru_cache
+from hashlib import sha1
 from pathlib import Path
 from os import environ
+from pickle import HIGHEST_PROTOCOL, PickleError, dump, load
 from re import compile as re_compile
 from subprocess import check_output
-from typing import Dict, Iterable, List, Optional, Set, Union
-from ..utilities import Stream
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from .cache import cache_dir
+from ..utilities import env_flag
 
-__all__ = ["MakeDict", "make_var", "make_vars"]
+__all__ = ["MakeDict", "MakeError", "make_var", "make_vars", "resolve_var"]
 
 MAKE_CMD = environ.get("MAKE", default="make")
 
+MAKE_CONF = Path(environ.get("__MAKE_CONF", default="/etc/make.conf"))
+
+# Defaults, as assigned using "?=" by Mk/bsd.port.mk, for variables that resolve_var() can compute
+MAKE_DEFAULTS = {
+    "DISTDIR": "${PORTSDIR}/distfiles",
+    "LOCALBASE": "/usr/local",
+    "PACKAGES": "${PORTSDIR}/packages",
+}
+
+# Number of parsed Makefiles kept in memory by make_vars()
+MAKEFILE_CACHE_SIZE = 1024
+
+# Also keep parsed Makefiles on disk, so they are reused between runs
+MAKEFILE_CACHE_PERSIST = env_flag("PORTCRAN_MAKEFILE_CACHE")
+
+# Incremented whenever the pickled representation of MakeDict changes
+MAKEFILE_CACHE_VERSION = 2
+
 VARIABLE_ASSIGNMENT = re_compile(r"^\s*(\w+)\s*([+?:]?)=(.*)$")
 
+VARIABLE_REFERENCE = re_compile(r"\$\{(\w+)\}")
+
 
 def make(path: Path, *args: str) -> str:
     return check_output((MAKE_CMD, '-C', str(path)) + args, text=True)
@@ -20,36 +44,184 @@ def make(path: Path, *args: str) -> str:
 
 def make_var(path: Path, var: str) -> List[str]:
     """Return a specified variable from the Makefile in the specified path."""
-    return make_vars(path)[var]
+    return make_vars(path, (var,))[var]
 
 
-def make_vars(path: Path) -> "MakeDict":
-    """Return an object representing the variables from the Makefile in the specified path."""
-    variables = MakeDict()
-    with open(path / "Makefile", "r") as makefile:
-        data = Stream(makefile.readlines(), lambda x: x.split("#", 2)[0].rstrip())
-        while True:
-            lines = list(data.take_while(lambda x: x.endswith("\\"), inclusive=True))
-            if not lines:
-                break
-            var = VARIABLE_ASSIGNMENT.search(" ".join(line.rstrip("\\") for line in lines))
+def make_vars(path: Path, names: Optional[Iterable[str]] = None) -> "MakeDict":
+    """
+    Return an object representing the variables from the Makefile in the specified path.
+
+    If variable names are specified then only those variables, and the variables they reference, are extracted from
+    the Makefile.  All other assignments are skipped without being processed.
+
+    Parsed Makefiles are cached, keyed by their path, modification time and size, so the returned object is a copy
+    that the caller is free to modify.
+    """
+    makefile = path / "Makefile"
+    stat = makefile.stat()
+    selection = None if names is None else frozenset(names)
+    return _parse_makefile(str(makefile), stat.st_mtime_ns, stat.st_size, selection).copy()
+
+
+@lru_cache(maxsize=MAKEFILE_CACHE_SIZE)
+def _parse_makefile(path: str, mtime: int, size: int, names: Optional[FrozenSet[str]]) -> "MakeDict":
+    if names is not None:
+        return _read_makefile_vars(path, names)
+    if not MAKEFILE_CACHE_PERSIST:
+        return _read_makefile(path)
+    pickled = cache_dir("makefiles", "%s.pickle" % sha1(path.encode("utf-8")).hexdigest())
+    try:
+        with pickled.open("rb") as pickle_file:
+            cached_key, variables = load(pickle_file)
+        if cached_key == (MAKEFILE_CACHE_VERSION, mtime, size) and isinstance(variables, MakeDict):
+            return variables
+    except (OSError, EOFError, PickleError, ValueError, TypeError, AttributeError):
+        pass
+    variables = _read_makefile(path)
+    tmpfile = pickled.with_suffix(".tmp%d" % id(variables))
+    try:
+        pickled.parent.mkdir(parents=True, exist_ok=True)
+        with tmpfile.open("wb") as pickle_file:
+            dump(((MAKEFILE_CACHE_VERSION, mtime, size), variables), pickle_file, HIGHEST_PROTOCOL)
+        tmpfile.replace(pickled)
+    except OSError:
+        pass
+    return variables
+
+
+def _assign(variables: "MakeDict", name: str, modifier: str, values: List[str]) -> None:
+    if modifier == "+":
+        variables.extend(name, values)
+    elif modifier == "?":
+        variables.add(name, values)
+    elif modifier == ":":
+        variables.add(name, values)
+        variables.set(name, variables[name])
+    else:
+        assert not modifier
+        variables.set(name, values)
+
+
+def _assignments(lines: Iterable[str]) -> Iterator[Tuple[str, str, str]]:
+    for line in _logical_lines(lines):
+        if "=" in line:
+            var = VARIABLE_ASSIGNMENT.match(line)
             if var is not None:
-                name = var.group(1)
-                modifier = var.group(2)
-                values = var.group(3).split()
-                if modifier == "+":
-                    variables.extend(name, values)
-                elif modifier == "?":
-                    variables.add(name, values)
-                elif modifier == ":":
-                    variables.add(name, values)
-                    variables.set(name, variables[name])
-                else:
-                    assert not modifier
-                    variables.set(name, values)
+                yield var.group(1), var.group(2), var.group(3)
+
+
+def _logical_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Yield the specified Makefile lines with comments stripped and lines ending with a backslash joined."""
+    continued: List[str] = []
+    for line in lines:
+        line = line.split("#", 1)[0].rstrip()
+        if line.endswith("\\"):
+            continued.append(line.rstrip("\\"))
+            continue
+        if continued:
+            continued.append(line)
+            line = " ".join(continued)
+            continued.clear()
+        yield line
+    if continued:
+        yield " ".join(continued)
+
+
+def _read_makefile(path: str) -> "MakeDict":
+    variables = MakeDict()
+    with open(path, "r") as makefile:
+        for name, modifier, values in tokenize(makefile):
+            _assign(variables, name, modifier, values)
+    return variables
+
+
+def _read_makefile_vars(path: str, names: FrozenSet[str]) -> "MakeDict":
+    """
+    Read only the specified variables, and those they reference, from a Makefile.
+
+    Assignments to other variables are set aside unprocessed.  If a variable is later found to be referenced then its
+    set aside assignments are replayed, in order, before the referencing assignment is applied.  Replaying an
+    immediate (":=") assignment could expand its references to later values, so the whole Makefile is read instead.
+    """
+    variables = MakeDict()
+    wanted = set(names)
+    skipped: Dict[str, List[Tuple[str, str]]] = {}
+    immediate: Set[str] = set()
+
+    def assign(name: str, modifier: str, value: str) -> None:
+        for reference in VARIABLE_REFERENCE.findall(value) if "$" in value else ():
+            if reference not in wanted:
+                wanted.add(reference)
+                for skipped_modifier, skipped_value in skipped.pop(reference, ()):
+                    assign(reference, skipped_modifier, skipped_value)
+        _assign(variables, name, modifier, value.split())
+
+    with open(path, "r") as makefile:
+        for name, modifier, value in _assignments(makefile):
+            if name in wanted:
+                assign(name, modifier, value)
+                if immediate and not immediate.isdisjoint(wanted):
+                    return _read_makefile(path)
+            else:
+                skipped.setdefault(name, []).append((modifier, value))
+                if modifier == ":" and "$" in value:
+                    immediate.add(name)
     return variables
 
 
+def tokenize(lines: Iterable[str]) -> Iterator[Tuple[str, str, List[str]]]:
+    """
+    Yield the name, modifier and values of each variable assignment in the specified Makefile lines.
+
+    The lines are consumed in a single pass, so a file object may be passed to stream the Makefile.  Comments are
+    stripped and lines ending with a backslash are joined to the next line.
+    """
+    return ((name, modifier, value.split()) for name, modifier, value in _assignments(lines))
+
+
+def resolve_var(name: str, portsdir: Path) -> Optional[str]:
+    """
+    Resolve a simple ports variable, such as DISTDIR, without running make(1).
+
+    The variable is computed from the environment, make.conf(5) and the defaults of Mk/bsd.port.mk.  None is returned
+    if the value cannot be computed reliably (i.e. make.conf has lines other than plain variable assignments, such as
+    conditionals or "!=" shell assignments, or the value contains expressions other than a plain variable reference),
+    in which case the caller should fall back to make(1).
+    """
+    defined: Dict[str, str] = dict(environ)
+    if MAKE_CONF.exists():
+        with MAKE_CONF.open() as make_conf:
+            lines = make_conf.readlines()
+        if any(line.strip() and VARIABLE_ASSIGNMENT.match(line) is None for line in _logical_lines(lines)):
+            return None
+        for var, modifier, values in tokenize(lines):
+            value = " ".join(values)
+            if modifier == "+" and var in defined:
+                defined[var] += " " + value
+            elif modifier != "?" or var not in defined:
+                defined[var] = value
+    defined.setdefault("PORTSDIR", str(portsdir))
+    for var, value in MAKE_DEFAULTS.items():
+        defined.setdefault(var, value)
+
+    def expand(var: str, expanding: Set[str]) -> Optional[str]:
+        if var not in defined or var in expanding:
+            return None
+        value = defined[var]
+        for reference in set(VARIABLE_REFERENCE.findall(value)):
+            subbed = expand(reference, expanding | {var})
+            if subbed is None:
+                return None
+            value = value.replace("${%s}" % reference, subbed)
+        return None if "$" in value else value
+
+    return expand(name, set())
+
+
+class MakeError(Exception):
+    pass
+
+
 class MakeDict:
     """
     A representation of a bmake(1) Makefile.
@@ -68,6 +240,8 @@ class MakeDict:
         """Initialise a new instance of the MakeDict class."""
         self._variables: Dict[str, List[str]] = OrderedDict()
         self._internal: Set[str] = set()
+        self._dependents: Dict[str, Set[str]] = {}
+        self._expanded: Dict[str, Tuple[List[str], Set[str]]] = {}
 
     def __contains__(self, item: str) -> bool:
         """Indicate if the specified variable name is contained in this collection."""
@@ -75,19 +249,16 @@ class MakeDict:
 
     def __getitem__(self, item: str) -> List[str]:
         """Get a variable's value, expanding if needed."""
-        values = self._variables[item]
-        subbed_values: List[str] = []
-        for value in values:
-            if value.startswith("${") and value.endswith("}"):
-                variable = value[2:-1]
-                if variable in self._variables:
-                    subbed_values.extend(self[variable])
-                    self._internal.add(variable)
-                else:
-                    subbed_values.append(value)
-            else:
-                subbed_values.append(value)
-        return subbed_values
+        return list(self._expand(item, ()))
+
+    def __getstate__(self) -> Tuple[Dict[str, List[str]], Set[str]]:
+        """Return the state to pickle, excluding the expansion cache."""
+        return self._variables, self._internal
+
+    def __setstate__(self, state: Tuple[Dict[str, List[str]], Set[str]]) -> None:
+        """Restore the pickled state."""
+        self.__init__()  # type: ignore
+        self._variables, self._internal = state
 
     def __str__(self) -> str:
         """Return a string representation of all public variables."""
@@ -97,6 +268,40 @@ class MakeDict:
                 unpopped.append("%s=%s" % (key, value))
         return ", ".join(unpopped)
 
+    def _expand(self, name: str, expanding: Tuple[str, ...]) -> List[str]:
+        """
+        Expand the specified variable, using the cached expansion if available.
+
+        The expansion is cached along with the variables it (recursively) references, which are marked as internal
+        on every access.  The names of variables being expanded are used to detect a reference cycle.
+        """
+        if name in expanding:
+            raise MakeError("MakeDict: variable '%s' references itself: %s" % (name, " -> ".join(expanding + (name,))))
+        if name not in self._expanded:
+            subbed_values: List[str] = []
+            references: Set[str] = set()
+            for value in self._variables[name]:
+                if value.startswith("${") and value.endswith("}"):
+                    variable = value[2:-1]
+                    self._dependents.setdefault(variable, set()).add(name)
+                    if variable in self._variables:
+                        subbed_values.extend(self._expand(variable, expanding + (name,)))
+                        references.add(variable)
+                        references.update(self._expanded[variable][1])
+                        continue
+                subbed_values.append(value)
+            self._expanded[name] = (subbed_values, references)
+        values, references = self._expanded[name]
+        self._internal.update(references)
+        return values
+
+    def _invalidate(self, name: str) -> None:
+        """Discard the cached expansion of the specified variable, and every variable that references it."""
+        if name in self._expanded:
+            del self._expanded[name]
+        for dependent in self._dependents.pop(name, ()):
+            self._invalidate(dependent)
+
     def add(self, name: str, values: List[str]) -> None:
         """Add (if not existing) the specified variable name and list of string values to this collection."""
         if name not in self._variables:
@@ -112,10 +317,19 @@ class MakeDict:
         """List of public variable names in this collection."""
         return [var for var in self._variables.keys() if var not in self._internal]
 
+    def copy(self) -> "MakeDict":
+        """Return a copy of this collection, including a copy of each variable's list of values."""
+        # pylint: disable=protected-access
+        variables = MakeDict()
+        variables._variables = OrderedDict((k, list(v)) for k, v in self._variables.items())
+        variables._internal = set(self._internal)
+        return variables
+
     def extend(self, name: str, values: List[str]) -> None:
         """Extend the specified variable with the specified list of strings."""
         if name in self._variables:
             self._variables[name].extend(values)
+            self._invalidate(name)
         else:
             self.set(name, values)
 
@@ -130,6 +344,7 @@ class MakeDict:
             return kwargs["default"]
         values = self[name]
         del self._variables[name]
+        self._invalidate(name)
         if name in self._internal:
             self._internal.remove(name)
         return values
@@ -160,3 +375,4 @@ class MakeDict:
     def set(self, name: str, values: List[str]) -> None:
         """Set the specified variable to the specified value."""
         self._variables[name] = values
+        self._invalidate(name)
@@ -4,13 +4,14 @@ from io import StringIO
 from itertools import groupby
 from math import ceil, floor
 from pathlib import Path
-from typing import (Any, Callable, Dict, Generic, IO, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar, Union,
-                    cast)
+from typing import (Any, Callable, ClassVar, Dict, Generic, IO, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar,
+                    Union, cast)
 from .dependency import Dependency
+from .distinfo import write_distinfo
 from .make import MakeDict, make, make_vars
 from .platform import Platform
 from .uses import Uses
-from ..utilities import Orderable
+from ..utilities import Orderable, env_flag
 
 __all__ = ["Port", "PortError", "PortStub"]
 
@@ -25,16 +26,32 @@ def peek(file: IO[Any], length: int) -> str:
     return value
 
 
+def port_descriptor(owner: type, name: str) -> "PortValue[Any]":
+    """Return the PortValue descriptor with the specified name from the class that defines it."""
+    return cast(PortValue[Any], vars(owner)[name])
+
+
 class PortValue(Orderable, Generic[T], metaclass=ABCMeta):  # pylint: disable=E1136
     def __init__(self, section: int, order: int = 1) -> None:
         super().__init__()
         self.order = order
         self.section = section
+        self._owner: Optional[type] = None
+        self._name: Optional[str] = None
 
     @abstractmethod
     def __get__(self, instance: "Port", owner: type) -> T:
         raise NotImplementedError()
 
+    def __reduce__(self) -> Tuple[Callable[[type, str], "PortValue[Any]"], Tuple[type, str]]:
+        # Pickle by reference so that unpickled ports key their values on the class's own descriptors
+        assert self._owner is not None and self._name is not None
+        return port_descriptor, (self._owner, self._name)
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self._owner = owner
+        self._name = name
+
     @property
     def _key(self) -> Tuple[int, int]:
         return self.section, self.order
@@ -279,6 +296,13 @@ class PortUses(PortObject):
         super().__init__()
         self._uses: Dict[type, Uses] = {}
 
+    def __getstate__(self) -> List[Uses]:
+        # Uses classes may be created dynamically, so cannot be pickled as dictionary keys
+        return list(self._uses.values())
+
+    def __setstate__(self, state: List[Uses]) -> None:
+        self._uses = {type(uses): uses for uses in state}
+
     def __contains__(self, item: Union[type, str]) -> bool:
         if isinstance(item, str):
             item = Uses.get(item)
@@ -361,6 +385,10 @@ class Port(PortStub):
 
     no_arch = PortVar(7, 1, "NO_ARCH")
 
+    makesum: ClassVar[bool] = env_flag("PORTCRAN_MAKESUM")
+
+    _port_values: ClassVar[List[PortValue[Any]]]
+
     def __init__(self, category: str, name: str, portdir: Optional[Path]) -> None:
         self._values: Dict[PortValue, Union[str, List[str], PortObject]] = {}
         self.categories = [category]
@@ -388,6 +416,11 @@ class Port(PortStub):
             raise PortError("Port: invalid categories, must start with: %s" % self.category)
         return categories
 
+    @property
+    def distfiles(self) -> Optional[List[Path]]:
+        """Paths to the port's distfiles, or None if not known (in which case `make makesum` is used)."""
+        return None
+
     @property
     def descr(self) -> Path:
         return self.portdir / "pkg-descr"
@@ -411,7 +444,7 @@ class Port(PortStub):
         port_makefile = self.portdir / "Makefile"
         metadata: List[str] = []
         if port_makefile.exists():
-            with port_makefile.open("rU") as makefile_file:
+            with port_makefile.open() as makefile_file:
                 for line in iter(makefile_file.readline, ""):
                     if line.startswith("# Created by") or line.startswith("# $FreeBSD"):
                         metadata.append(line)
@@ -422,7 +455,8 @@ class Port(PortStub):
         makefile.writelines(metadata)
 
     def _gen_sections(self, makefile: StringIO) -> None:
-        for _, items in groupby(sorted(list(self._values.items()), key=lambda k: k[0]), lambda k: k[0].section):
+        values_set = ((i, self._values[i]) for i in self.port_values() if i in self._values)
+        for _, items in groupby(values_set, lambda k: k[0].section):
             values = [j for i in items for j in i[0].generate(i[1])]
             if not values:
                 continue
@@ -452,7 +486,11 @@ class Port(PortStub):
                 makefile.write("\n")
 
     def _gen_distinfo(self) -> None:
-        make(self.portdir, 'makesum')
+        distfiles = self.distfiles
+        if Port.makesum or distfiles is None:
+            make(self.portdir, 'makesum')
+        else:
+            write_distinfo(self.portdir / "distinfo", distfiles)
 
     def _gen_descr(self) -> None:
         if self.description is None:
@@ -495,14 +533,8 @@ class Port(PortStub):
 
     def load(self) -> None:
         variables = make_vars(self.portdir)
-        bases = [type(self)]
-        i = 0
-        while i < len(bases):
-            bases.extend(j for j in bases[i].__bases__ if j not in bases)
-            for var in list(vars(bases[i]).values()):
-                if isinstance(var, PortValue):
-                    var.load(self, variables)
-            i += 1
+        for var in self.port_values():
+            var.load(self, variables)
         if not variables.all_popped:
             # TODO: remove once all R-cran ports have been verified
             print("Unloaded variables for %s:" % self.name, variables)
@@ -529,3 +561,23 @@ class Port(PortStub):
 
     def set_value(self, port_value: PortValue, value: Union[str, List[str], PortObject]) -> None:
         self._values[port_value] = value
+
+    @classmethod
+    def port_values(cls) -> List[PortValue[Any]]:
+        """
+        Return the PortValue descriptors of this class, sorted by section and order.
+
+        A descriptor shadowed by an attribute of the same name in a subclass is excluded.  The descriptors are found
+        once per class, on first use.
+        """
+        if "_port_values" not in vars(cls):
+            names: Set[str] = set()
+            port_values = []
+            for klass in cls.__mro__:
+                for name, var in vars(klass).items():
+                    if name not in names:
+                        names.add(name)
+                        if isinstance(var, PortValue):
+                            port_values.append(var)
+            cls._port_values = sorted(port_values)
+        return cls._port_values
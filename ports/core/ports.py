@@ -3,65 +3,199 @@
 This module provides an interface to interact with the FreeBSD Ports Collection, and means of discovering ports
 therein.
 """
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from hashlib import sha1
+from io import StringIO
+from json import dump, load
 from os import environ
-from typing import Callable, ClassVar, List, Optional
+from traceback import format_exc
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Tuple
 from pathlib import Path
-from .make import make, make_var
+from .cache import cache_dir
+from .make import make, make_var, resolve_var
 from .port import Port, PortError, PortStub
+from ..utilities import LazyAttribute
 
 __all__ = ['Ports']
 
+INDEX_VERSION = 1
+
 
 class Ports:
     """Representation of the FreeBSD Ports Collection."""
 
     _factories: ClassVar[List[Callable[[PortStub], Optional[Port]]]] = []
+    _loaded: ClassVar[Dict[str, Port]] = {}
     _ports: ClassVar[List[PortStub]] = []
+    _ports_by_name: ClassVar[Dict[str, List[PortStub]]] = {}
+    _ports_by_origin: ClassVar[Dict[str, PortStub]] = {}
     dir: ClassVar[Path] = Path(environ.get('PORTSDIR', '/usr/ports'))
+    jobs: ClassVar[Optional[int]] = int(environ['PORTCRAN_JOBS']) if environ.get('PORTCRAN_JOBS') else None
 
-    categories = make_var(dir, 'SUBDIR')
-    distdir = Path(environ.get('DISTDIR') or make(dir / 'Mk', '-VDISTDIR', '-fbsd.port.mk').strip())
+    categories = LazyAttribute(lambda: make_var(Ports.dir, 'SUBDIR'))
+    distdir = LazyAttribute(
+        lambda: Path(resolve_var('DISTDIR', Ports.dir) or make(Ports.dir / 'Mk', '-VDISTDIR', '-fbsd.port.mk').strip()))
 
     @staticmethod
-    def _get_port(selector: Callable[[PortStub], bool]) -> Port:
-        if not Ports._ports:
-            Ports._load_ports()
-        ports = [i for i in Ports._ports if selector(i)]
+    def _add_stub(portstub: PortStub) -> None:
+        Ports._ports.append(portstub)
+        Ports._ports_by_name.setdefault(portstub.name, []).append(portstub)
+        Ports._ports_by_origin[portstub.origin] = portstub
+
+    @staticmethod
+    def _get_port(ports: List[PortStub]) -> Port:
         if not ports:
             raise PortError('Ports: no port matches requirement')
         if len(ports) > 1:
             raise PortError('Ports: multiple ports match requirement')
-        if isinstance(ports[0], PortStub):
-            portstub = ports[0]
+        return Ports._materialize(ports[0])
+
+    @staticmethod
+    def _load_port(origin: str) -> Tuple[Optional[Port], Optional[str]]:
+        """Load the port with the specified origin, returning the port and any error (or diagnostics) reported."""
+        output = StringIO()
+        try:
+            with redirect_stdout(output), redirect_stderr(output):
+                port = Ports.get_port_by_origin(origin)
+        except Exception:  # pylint: disable=broad-except
+            return None, output.getvalue() + format_exc()
+        return port, output.getvalue() or None
+
+    @staticmethod
+    def _materialize(portstub: PortStub) -> Port:
+        """Create, or return the previously created, Port for the specified PortStub."""
+        if portstub.origin not in Ports._loaded:
             for factory in reversed(Ports._factories):
                 port = factory(portstub)
                 if port is not None:
-                    Ports._ports[Ports._ports.index(ports[0])] = port
+                    Ports._loaded[portstub.origin] = port
                     break
             else:
-                raise PortError('Ports: unable to create port from origin \'%s\'' % ports[0].origin)
-        else:
-            assert isinstance(ports[0], Port)
-            port = ports[0]
-        return port
+                raise PortError('Ports: unable to create port from origin \'%s\'' % portstub.origin)
+        return Ports._loaded[portstub.origin]
+
+    @staticmethod
+    def _index_path() -> Path:
+        return cache_dir('index', '%s.json' % sha1(str(Ports.dir.resolve()).encode('utf-8')).hexdigest())
 
     @staticmethod
     def _load_ports() -> None:
         print('Loading ports collection:')
-        for category in Ports.categories:
-            print('\tLoading category: %s' % category)
-            for name in make_var(Ports.dir / category, 'SUBDIR'):
-                Ports._ports.append(PortStub(category, name))
+        index = Ports._read_index()
+        categories: Dict[str, Dict[str, Any]] = {}
+        with ThreadPoolExecutor(Ports.jobs) as executor:
+            scans = executor.map(lambda c: Ports._scan_category(c, index.get(c)), Ports.categories)
+            for category, (scanned, entry) in zip(Ports.categories, scans):
+                if scanned:
+                    print('\tLoading category: %s' % category)
+                categories[category] = entry
+                for name in entry['ports']:
+                    Ports._add_stub(PortStub(category, name))
+        if categories != index:
+            Ports._write_index(categories)
+
+    @staticmethod
+    def _read_index() -> Dict[str, Dict[str, Any]]:
+        """Read the persistent index of ports, keyed by category, returning an empty index if it is unusable."""
+        try:
+            with Ports._index_path().open() as index_file:
+                index = load(index_file)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(index, dict) or index.get('version') != INDEX_VERSION or index.get('dir') != str(Ports.dir):
+            return {}
+        return dict(index['categories'])
+
+    @staticmethod
+    def _scan_category(category: str, entry: Optional[Dict[str, Any]]) -> Tuple[bool, Dict[str, Any]]:
+        """Return the index entry for a category, and if it needed scanning, given its previous index entry."""
+        stat = (Ports.dir / category / 'Makefile').stat()
+        if entry is not None and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return False, entry
+        return True, {
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'ports': make_var(Ports.dir / category, 'SUBDIR'),
+        }
+
+    @staticmethod
+    def _write_index(categories: Dict[str, Dict[str, Any]]) -> None:
+        """Write the persistent index of ports, silently ignoring an unwritable cache."""
+        path = Ports._index_path()
+        tmpfile = path.with_suffix('.tmp')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tmpfile.open('w') as index_file:
+                dump({'version': INDEX_VERSION, 'dir': str(Ports.dir), 'categories': categories}, index_file)
+            tmpfile.replace(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def find_ports(prefix: str = '') -> List[PortStub]:
+        """Find, without loading, all ports with a name starting with the specified prefix."""
+        if not Ports._ports:
+            Ports._load_ports()
+        return [i for i in Ports._ports if i.name.startswith(prefix)]
+
+    @staticmethod
+    def find_port_by_name(name: str) -> Optional[PortStub]:
+        """
+        Find, without loading, the port with the specified name, returning None if there is no such port.
+
+        Only the category, name and origin of the returned port are available without loading it (see get_port_by_name).
+        """
+        if not Ports._ports:
+            Ports._load_ports()
+        ports = Ports._ports_by_name.get(name, [])
+        if len(ports) > 1:
+            raise PortError('Ports: multiple ports match requirement')
+        return ports[0] if ports else None
 
     @staticmethod
     def get_port_by_name(name: str) -> Port:
         """Get a port by the specified name."""
-        return Ports._get_port(lambda i: i.name == name)
+        if not Ports._ports:
+            Ports._load_ports()
+        return Ports._get_port(Ports._ports_by_name.get(name, []))
 
     @staticmethod
     def get_port_by_origin(origin: str) -> Port:
         """Get a port by the specified port origin."""
-        return Ports._get_port(lambda i: i.origin == origin)
+        if not Ports._ports:
+            Ports._load_ports()
+        portstub = Ports._ports_by_origin.get(origin)
+        return Ports._get_port([] if portstub is None else [portstub])
+
+    @staticmethod
+    def load_all(prefix: str = '', jobs: Optional[int] = None) -> Tuple[List[Port], Dict[str, str]]:
+        """
+        Load all ports with a name starting with the specified prefix, using a pool of processes.
+
+        The number of processes defaults to the number of CPUs.  The loaded ports are returned, in collection order,
+        along with the errors (or diagnostics) reported while loading each port, keyed by port origin.
+        """
+        if not Ports._ports:
+            Ports._load_ports()
+        origins = [i.origin for i in Ports._ports if i.name.startswith(prefix) and i.origin not in Ports._loaded]
+        errors: Dict[str, str] = {}
+        with ProcessPoolExecutor(jobs) as executor:
+            for origin, (port, error) in zip(origins, executor.map(Ports._load_port, origins, chunksize=16)):
+                if port is not None:
+                    Ports._loaded[origin] = port
+                if error is not None:
+                    errors[origin] = error
+        ports = [Ports._loaded[i.origin] for i in Ports._ports if i.origin in Ports._loaded]
+        return [i for i in ports if i.name.startswith(prefix)], errors
+
+    @staticmethod
+    def register(port: Port) -> None:
+        """Add a newly created port to the ports collection, i.e. so it can be found as a dependency of other ports."""
+        if not Ports._ports:
+            Ports._load_ports()
+        Ports._add_stub(port)
+        Ports._loaded[port.origin] = port
 
     @staticmethod
     def factory(factory: Callable[[PortStub], Optional[Port]]) -> Callable[[PortStub], Optional[Port]]:
@@ -1,5 +1,5 @@
 from abc import ABCMeta
-from typing import Callable, ClassVar, Dict, Iterable, List, Optional, Set, Tuple
+from typing import Any, Callable, ClassVar, Dict, Iterable, List, Optional, Set, Tuple
 from .make import MakeDict
 from ..utilities import Orderable
 
@@ -22,6 +22,10 @@ class Uses(Orderable, metaclass=ABCMeta):
     def __str__(self) -> str:
         return self.name + (":" + ",".join(sorted(self._args)) if self._args else "")
 
+    def __reduce__(self) -> Tuple[Callable[[str, Dict[str, Any]], "Uses"], Tuple[str, Dict[str, Any]]]:
+        # Uses classes may be created dynamically, so pickle through the registry instead of the class
+        return Uses.restore, (self.name, self.__dict__)
+
     @property
     def _key(self) -> str:
         return self.name
@@ -38,6 +42,12 @@ class Uses(Orderable, metaclass=ABCMeta):
             return klass
         return doregister
 
+    @staticmethod
+    def restore(name: str, state: Dict[str, Any]) -> "Uses":
+        uses: Uses = Uses.get(name)()
+        uses.__dict__.update(state)
+        return uses
+
     def add(self, arg: str) -> None:
         self._args.add(arg)
 
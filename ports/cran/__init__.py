@@ -1,4 +1,9 @@
+from .fetch import Fetcher
+from .graph import DependencyGraph
+from .index import CranIndex
+from .metadata import CranMetadata
+from .network import ConnectionPool
 from .port import CranPort
 from .uses import Cran
 
-__all__ = ["Cran", "CranPort"]
+__all__ = ["ConnectionPool", "Cran", "CranIndex", "CranMetadata", "CranPort", "DependencyGraph", "Fetcher"]
@@ -0,0 +1,174 @@
+"""Concurrent downloading of CRAN source packages into DISTDIR."""
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import md5, sha256
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+from .index import CranIndex
+from ..core import PortError, Ports
+from ..core.distinfo import record_checksum
+
+__all__ = ["Fetcher"]
+
+CHUNK_SIZE = 1 << 16
+
+
+class Fetcher(object):
+    """
+    Download CRAN source packages (distfiles) concurrently using a bounded pool of threads.
+
+    Each distfile is downloaded to a ".part" file, resuming a previous partial download using a HTTP Range request,
+    and is verified against the size reported by the server and the MD5 checksum published in the CRAN index (when
+    available) before being atomically renamed into place.  A distfile therefore only exists once complete.
+    """
+
+    def __init__(self, index: CranIndex, distdir: Optional[Path] = None, jobs: Optional[int] = None) -> None:
+        """
+        Initialise the fetcher with the CRAN index to download from.
+
+        The distfiles are placed in the specified directory (defaulting to the ports DISTDIR) using up to the
+        specified number of concurrent downloads (defaulting to Ports.jobs).  The number of concurrent downloads may
+        be changed until the first download is scheduled.
+        """
+        self.index = index
+        self.jobs = jobs
+        self._distdir = distdir
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._fetching: Dict[str, "Future[Path]"] = {}
+        self._lock = Lock()
+
+    def __enter__(self) -> "Fetcher":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @property
+    def distdir(self) -> Path:
+        """The directory distfiles are placed in."""
+        return Ports.distdir if self._distdir is None else self._distdir
+
+    def _checksum(self, name: str, version: str) -> Optional[str]:
+        if name in self.index and self.index.version(name) == version:
+            return self.index[name].get("MD5sum")
+        return None
+
+    def _download(self, name: str, version: str, distfile: Path, checksum: Optional[str]) -> Path:
+        if distfile.exists():
+            if checksum is None:
+                return distfile
+            md5_digest, sha256_digest = self._digests(distfile)
+            if md5_digest == checksum:
+                record_checksum(distfile, sha256_digest)
+                return distfile
+            print("Discarding corrupt package source (%s-%s)..." % (name, version))
+            distfile.unlink()
+        self.distdir.mkdir(parents=True, exist_ok=True)
+        partfile = distfile.with_name(distfile.name + ".part")
+        urls = [
+            "%s/src/contrib/%s" % (self.index.mirror, distfile.name),
+            "%s/src/contrib/Archive/%s/%s" % (self.index.mirror, name, distfile.name),
+        ]
+        for url in urls:
+            size = self._retrieve(url, partfile)
+            if size is not None:
+                break
+        else:
+            raise PortError("CRAN: unable to fetch package source %s" % distfile.name)
+        actual_size = partfile.stat().st_size
+        if size >= 0 and actual_size != size:
+            raise PortError("CRAN: package source %s is incomplete (%d of %d bytes)" %
+                            (distfile.name, actual_size, size))
+        md5_digest, sha256_digest = self._digests(partfile)
+        if checksum is not None and md5_digest != checksum:
+            partfile.unlink()
+            raise PortError("CRAN: package source %s does not match the MD5 checksum" % distfile.name)
+        partfile.replace(distfile)
+        record_checksum(distfile, sha256_digest)
+        return distfile
+
+    def _forget(self, key: str, future: "Future[Path]") -> None:
+        # Allow a failed download to be retried
+        if future.exception() is not None:
+            with self._lock:
+                if self._fetching.get(key) is future:
+                    del self._fetching[key]
+
+    @staticmethod
+    def _digests(path: Path) -> Tuple[str, str]:
+        """Return the MD5 (as published by CRAN) and SHA256 (as used by distinfo) checksums of the specified file."""
+        md5_digest = md5()
+        sha256_digest = sha256()
+        with path.open("rb") as data:
+            for chunk in iter(lambda: data.read(CHUNK_SIZE), b""):
+                md5_digest.update(chunk)
+                sha256_digest.update(chunk)
+        return md5_digest.hexdigest(), sha256_digest.hexdigest()
+
+    def _retrieve(self, url: str, partfile: Path) -> Optional[int]:
+        """
+        Download the URL to the partial file, resuming if already partially downloaded.
+
+        Return the expected size of the complete file (or -1 if unknown), or None if the URL does not exist.
+        """
+        offset = partfile.stat().st_size if partfile.exists() else 0
+        headers = {"Range": "bytes=%d-" % offset} if offset else {}
+        with self.index.pool.request(url, headers) as response:
+            if response.status == 416:
+                # The partial file is no smaller than the complete file, so cannot be trusted
+                response.read()
+                partfile.unlink()
+                return self._retrieve(url, partfile)
+            if response.status == 404:
+                response.read()
+                return None
+            if response.status not in (200, 206):
+                raise PortError("CRAN: unable to fetch %s: status %d" % (url, response.status))
+            if response.status == 200:
+                offset = 0
+                length = response.headers.get("Content-Length")
+                size = int(length) if length is not None else -1
+            else:
+                content_range = response.headers.get("Content-Range", "")
+                total = content_range.rsplit("/", 1)[-1]
+                size = int(total) if total.isdigit() else -1
+            with partfile.open("r+b" if offset else "wb") as output:
+                output.seek(offset)
+                output.truncate()
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                    output.write(chunk)
+        return size
+
+    def close(self) -> None:
+        """Wait for all downloads to finish and release the pool of threads."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def distfile(self, name: str, version: str) -> Path:
+        """Return the path of the distfile for the specified package version."""
+        return self.distdir / ("%s_%s.tar.gz" % (name, version))
+
+    def fetch(self, name: str, version: str) -> Path:
+        """Download, if needed, the specified package version and return the path to its distfile."""
+        return self.submit(name, version).result()
+
+    def submit(self, name: str, version: str) -> "Future[Path]":
+        """Schedule the download, if needed, of the specified package version and return a future for its distfile."""
+        distfile = self.distfile(name, version)
+        checksum = self._checksum(name, version)
+        key = str(distfile)
+        with self._lock:
+            if key in self._fetching:
+                return self._fetching[key]
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.jobs or Ports.jobs)
+            future = self._executor.submit(self._download, name, version, distfile, checksum)
+            self._fetching[key] = future
+        # Registered without the lock held as the callback runs immediately (and takes the lock) if already done
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def submit_all(self, packages: "Dict[str, str]") -> "Dict[str, Future[Path]]":
+        """Schedule the download of the specified packages (mapping name to version), returning a future for each."""
+        return {name: self.submit(name, version) for name, version in packages.items()}
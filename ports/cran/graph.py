@@ -0,0 +1,160 @@
+"""The graph of dependencies between CRAN packages (and their ports)."""
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set
+from .index import CranIndex
+from .port import DEPENDENCY, INTERNAL_PACKAGES
+from .uses import Cran
+from ..core import Port, PortError
+from ..dependency import PortDependency
+
+__all__ = ["DependencyGraph"]
+
+# The CRAN DESCRIPTION fields that correspond to each kind of port dependency
+CRAN_DEPENDS = {
+    "build": ("LinkingTo", "VignetteBuilder"),
+    "run": ("Depends", "Imports"),
+    "test": ("Suggests",),
+}
+
+DEPENDS = ("build", "run", "test")
+
+
+def package_names(value: str) -> List[str]:
+    """Return the names of the (non-internal) packages listed in a CRAN dependency field, i.e. "Imports"."""
+    names = []
+    for cran in (i.strip() for i in value.split(",")):
+        depend = DEPENDENCY.match(cran)
+        if depend is not None and depend.group(1) not in INTERNAL_PACKAGES:
+            names.append(depend.group(1))
+    return names
+
+
+class DependencyGraph(object):
+    """
+    Forward and reverse dependency edges between CRAN packages, keyed by CRAN package name.
+
+    Edges may be added (or replaced) and removed per package as ports and packages change.  A package that is only
+    depended upon is part of the graph, without any dependencies of its own, until its dependencies are added.
+    """
+
+    def __init__(self) -> None:
+        """Initialise an empty dependency graph."""
+        self._depends: Dict[str, Set[str]] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+
+    def __contains__(self, name: str) -> bool:
+        """Indicate if the specified package is part of the graph."""
+        return name in self._depends
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the names of all packages in the graph."""
+        return iter(self._depends)
+
+    def __len__(self) -> int:
+        """Return the number of packages in the graph."""
+        return len(self._depends)
+
+    def add(self, name: str, depends: Iterable[str]) -> None:
+        """Set the dependencies of the specified package, replacing any dependencies previously added."""
+        self.remove(name)
+        self._depends[name] = set(depends) - {name}
+        self._dependents.setdefault(name, set())
+        for depend in self._depends[name]:
+            self._depends.setdefault(depend, set())
+            self._dependents.setdefault(depend, set()).add(name)
+
+    def add_index(self, index: CranIndex, names: Iterable[str], depends: Sequence[str] = DEPENDS) -> None:
+        """Add the dependencies, of the specified kinds, of the specified packages as published in the CRAN index."""
+        for name in names:
+            package = index[name]
+            self.add(name, (j for i in depends for k in CRAN_DEPENDS[i] for j in package_names(package.get(k, ""))))
+
+    def add_ports(self, ports: Iterable[Port], depends: Sequence[str] = DEPENDS) -> None:
+        """Add the dependencies, of the specified kinds, between the specified CRAN ports (i.e. from Ports.load_all)."""
+        for port in ports:
+            if port.portname is None or not port.name.startswith(Cran.PKGNAMEPREFIX):
+                continue
+            names = []
+            for collection in depends:
+                for depend in getattr(port.depends, collection):
+                    if isinstance(depend, PortDependency) and depend.pkgname.startswith(Cran.PKGNAMEPREFIX):
+                        names.append(depend.pkgname[len(Cran.PKGNAMEPREFIX):])
+            self.add(port.portname, names)
+
+    def closure(self, names: Iterable[str]) -> Set[str]:
+        """Return the specified packages and all the packages they (indirectly) depend upon."""
+        return self._closure(names, self._depends)
+
+    def depends(self, name: str) -> Set[str]:
+        """Return the packages the specified package directly depends upon."""
+        return set(self._depends.get(name, ()))
+
+    def dependents(self, name: str) -> Set[str]:
+        """Return the packages that directly depend upon the specified package."""
+        return set(self._dependents.get(name, ()))
+
+    def order(self, names: Optional[Iterable[str]] = None) -> List[str]:
+        """Return the specified packages (defaulting to all packages) ordered such that dependencies come first."""
+        return [j for i in self.waves(names) for j in i]
+
+    def remove(self, name: str) -> None:
+        """
+        Remove the dependencies of the specified package.
+
+        The package remains part of the graph, without any dependencies, while other packages depend upon it.
+        """
+        for depend in self._depends.pop(name, ()):
+            self._dependents[depend].discard(name)
+        if self._dependents.get(name):
+            self._depends[name] = set()
+        else:
+            self._dependents.pop(name, None)
+
+    def reverse_closure(self, names: Iterable[str]) -> Set[str]:
+        """Return the specified packages and all the packages that (indirectly) depend upon them."""
+        return self._closure(names, self._dependents)
+
+    def waves(self, names: Optional[Iterable[str]] = None) -> List[List[str]]:
+        """
+        Partition the specified packages (defaulting to all packages) into waves that may be processed concurrently.
+
+        Each package only depends upon packages in earlier waves, considering only dependencies between the specified
+        packages.  A PortError is raised if the packages have a dependency cycle.
+        """
+        pending = set(self._depends if names is None else names)
+        remaining = {i: len(self._depends.get(i, set()) & pending) for i in pending}
+        wave = sorted(i for i, j in remaining.items() if not j)
+        waves = []
+        while wave:
+            waves.append(wave)
+            for name in wave:
+                del remaining[name]
+            following = set()
+            for name in wave:
+                for dependent in self._dependents.get(name, ()):
+                    if dependent in remaining:
+                        remaining[dependent] -= 1
+                        if not remaining[dependent]:
+                            following.add(dependent)
+            wave = sorted(following)
+        if remaining:
+            raise PortError("CRAN: dependency cycle between packages: %s" % " -> ".join(self._cycle(set(remaining))))
+        return waves
+
+    def _closure(self, names: Iterable[str], edges: Dict[str, Set[str]]) -> Set[str]:
+        closure: Set[str] = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in closure:
+                closure.add(name)
+                pending.extend(edges.get(name, ()))
+        return closure
+
+    def _cycle(self, names: Set[str]) -> List[str]:
+        """Return a dependency cycle between the specified packages, every one of which has a dependency within."""
+        path = [min(names)]
+        while True:
+            name = min(self._depends[path[-1]] & names)
+            if name in path:
+                return path[path.index(name):] + [name]
+            path.append(name)
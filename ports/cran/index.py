@@ -0,0 +1,130 @@
+"""The index of packages published by a CRAN mirror."""
+from gzip import decompress
+from json import dump, load
+from os import environ
+from typing import Dict, Iterator, Optional
+from .network import ConnectionPool
+from ..core import PortError
+from ..core.cache import cache_dir
+
+__all__ = ["CranIndex"]
+
+CRAN_MIRROR = environ.get("CRAN_MIRROR", default="https://cran.r-project.org")
+
+Package = Dict[str, str]
+
+
+class CranIndex(object):
+    """
+    The packages, and their metadata, listed in the src/contrib/PACKAGES.gz index of a CRAN mirror.
+
+    The index is downloaded at most once per instance, on first use.  A copy is kept in the cache directory and is
+    revalidated using a conditional request (ETag and Last-Modified), so an unchanged index is not downloaded again.
+    """
+
+    def __init__(self, mirror: str = CRAN_MIRROR, pool: Optional[ConnectionPool] = None) -> None:
+        """
+        Initialise the index for the specified mirror (a http(s):// or file:// URL).
+
+        Requests are made through the specified connection pool, or a private pool if none is specified.
+        """
+        self.mirror = mirror.rstrip("/")
+        self.pool = ConnectionPool() if pool is None else pool
+        self._packages: Optional[Dict[str, Package]] = None
+
+    def __contains__(self, name: str) -> bool:
+        """Indicate if the specified package is published by CRAN."""
+        return name in self.packages
+
+    def __getitem__(self, name: str) -> Package:
+        """Get the metadata for the specified package."""
+        if name not in self.packages:
+            raise PortError("CRAN: package %s does not exist" % name)
+        return self.packages[name]
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the names of all published packages."""
+        return iter(self.packages)
+
+    @property
+    def packages(self) -> Dict[str, Package]:
+        """Metadata of all published packages, keyed by package name."""
+        if self._packages is None:
+            self._packages = self.parse(decompress(self._fetch()).decode("utf-8"))
+        return self._packages
+
+    @property
+    def url(self) -> str:
+        """URL of the index."""
+        return "%s/src/contrib/PACKAGES.gz" % self.mirror
+
+    def _fetch(self) -> bytes:
+        index = cache_dir("cran", "PACKAGES.gz")
+        metadata = cache_dir("cran", "PACKAGES.json")
+        headers: Dict[str, str] = {}
+        try:
+            with metadata.open() as metadata_file:
+                cached = load(metadata_file)
+            if cached["url"] == self.url and index.exists():
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last-modified"):
+                    headers["If-Modified-Since"] = cached["last-modified"]
+        except (OSError, ValueError, KeyError):
+            pass
+        try:
+            with self.pool.request(self.url, headers) as response:
+                status = response.status
+                data = response.read()
+                cached = {
+                    "url": self.url,
+                    "etag": response.headers.get("ETag"),
+                    "last-modified": response.headers.get("Last-Modified"),
+                }
+        except (OSError, PortError) as ex:
+            if not index.exists():
+                raise PortError("CRAN: unable to fetch package index: %s" % ex) from ex
+            print("CRAN: unable to revalidate package index, using cached copy: %s" % ex)
+            return index.read_bytes()
+        if status == 304:
+            return index.read_bytes()
+        if status != 200:
+            if not index.exists():
+                raise PortError("CRAN: unable to fetch package index: status %d" % status)
+            print("CRAN: unable to revalidate package index, using cached copy: status %d" % status)
+            return index.read_bytes()
+        try:
+            index.parent.mkdir(parents=True, exist_ok=True)
+            index.with_suffix(".tmp").write_bytes(data)
+            index.with_suffix(".tmp").replace(index)
+            with metadata.open("w") as metadata_file:
+                dump(cached, metadata_file)
+        except OSError:
+            pass
+        return data
+
+    @staticmethod
+    def parse(index: str) -> Dict[str, Package]:
+        """Parse the Debian Control File formatted index into the metadata of each package, keyed by package name."""
+        packages: Dict[str, Package] = {}
+        package: Package = {}
+        key = None
+        for line in index.splitlines():
+            if not line.strip():
+                if "Package" in package:
+                    packages[package["Package"]] = package
+                package = {}
+                key = None
+            elif line[0].isspace():
+                if key is not None:
+                    package[key] += " " + line.strip()
+            else:
+                key, value = line.split(":", 1)
+                package[key] = value.strip()
+        if "Package" in package:
+            packages[package["Package"]] = package
+        return packages
+
+    def version(self, name: str) -> str:
+        """Get the latest published version of the specified package."""
+        return self[name]["Version"]
@@ -0,0 +1,64 @@
+"""Persistent cache of the metadata parsed from CRAN source packages."""
+from json import dump, load
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from ..core.cache import cache_dir
+
+__all__ = ["CranMetadata"]
+
+# Incremented whenever the parsing of DESCRIPTION files or changelogs changes
+METADATA_VERSION = 1
+
+Changelog = Dict[str, List[str]]
+
+Description = List[Tuple[str, str, int]]
+
+
+class CranMetadata(object):
+    """
+    The DESCRIPTION entries and changelog parsed from a CRAN source package.
+
+    The metadata is cached per package version and SHA256 checksum of the source package (as recorded in a port's
+    distinfo), so it remains available after the source package has been removed from DISTDIR.
+    """
+
+    def __init__(self, version: str, description: Description, changelog: Changelog) -> None:
+        """Initialise the metadata with the package version, its (key, value, line) entries and its changelog."""
+        self.version = version
+        self.description = description
+        self.changelog = changelog
+
+    @staticmethod
+    def _path(name: str, checksum: str) -> Path:
+        return cache_dir("cran", "metadata", name, "%s.json" % checksum)
+
+    @staticmethod
+    def lookup(name: str, checksum: str, version: Optional[str] = None) -> Optional["CranMetadata"]:
+        """
+        Return the cached metadata of the package with the specified name and checksum, or None if not cached.
+
+        If a version is specified then the cached metadata must also be for that version.
+        """
+        try:
+            with CranMetadata._path(name, checksum).open(encoding="utf-8") as metadata_file:
+                metadata = load(metadata_file)
+            if metadata["version"] != METADATA_VERSION or version not in (None, metadata["package"]["version"]):
+                return None
+            package = metadata["package"]
+            description = [(key, value, line) for key, value, line in package["description"]]
+            return CranMetadata(package["version"], description, package["changelog"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, name: str, checksum: str) -> None:
+        """Cache the metadata of the package with the specified name and checksum, ignoring an unwritable cache."""
+        path = self._path(name, checksum)
+        tmpfile = path.with_suffix(".tmp")
+        package = {"version": self.version, "description": self.description, "changelog": self.changelog}
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tmpfile.open("w", encoding="utf-8") as metadata_file:
+                dump({"version": METADATA_VERSION, "package": package}, metadata_file)
+            tmpfile.replace(path)
+        except OSError:
+            pass
@@ -0,0 +1,158 @@
+"""Persistent HTTP connections shared by requests to CRAN."""
+from contextlib import contextmanager
+from http.client import HTTPConnection, HTTPException, HTTPResponse, HTTPSConnection, RemoteDisconnected
+from io import BytesIO
+from os import environ
+from threading import Lock
+from time import sleep
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.error import URLError
+from urllib.parse import urljoin, urlsplit
+from urllib.request import urlopen
+from ..core import PortError
+
+__all__ = ["ConnectionPool", "Response"]
+
+HTTP_TIMEOUT = float(environ.get("PORTCRAN_TIMEOUT", default="30"))
+
+HTTP_RETRIES = int(environ.get("PORTCRAN_RETRIES", default="3"))
+
+MAX_IDLE = 8
+
+MAX_REDIRECTS = 5
+
+REDIRECTS = (301, 302, 303, 307, 308)
+
+# Errors from sending a request on an idle connection that the server has since closed
+STALE_ERRORS = (BrokenPipeError, ConnectionResetError, RemoteDisconnected)
+
+Host = Tuple[str, str, Optional[int]]
+
+
+class Response(object):
+    # pylint: disable=too-few-public-methods
+    """The status, headers and (streamed) body of a response."""
+
+    def __init__(self, status: int, headers: Any, stream: Any) -> None:
+        """Initialise the response with its status, headers (supporting get()) and a stream with a read() method."""
+        self.status = status
+        self.headers = headers
+        self._stream = stream
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        """Read up to the specified number of bytes from the body, or the whole body if no amount is specified."""
+        return bytes(self._stream.read() if amt is None else self._stream.read(amt))
+
+
+class ConnectionPool(object):
+    """
+    A pool of keep-alive HTTP(S) connections, kept per host.
+
+    Requests that fail to connect, or receive a server error, are retried with an exponential backoff.  URLs with a
+    scheme other than http or https (i.e. file://) are opened using urllib, with a missing file reported as a 404.
+    """
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT, retries: int = HTTP_RETRIES, backoff: float = 0.5) -> None:
+        """Initialise the pool with the socket timeout (in seconds), number of retries and initial backoff delay."""
+        self.backoff = backoff
+        self.retries = retries
+        self.timeout = timeout
+        self._idle: Dict[Host, List[HTTPConnection]] = {}
+        self._lock = Lock()
+
+    def _acquire(self, host: Host) -> Tuple[HTTPConnection, bool]:
+        """Return an idle connection to the host, or a new connection, and if the connection is being reused."""
+        with self._lock:
+            if self._idle.get(host):
+                return self._idle[host].pop(), True
+        scheme, hostname, port = host
+        if scheme == "https":
+            return HTTPSConnection(hostname, port, timeout=self.timeout), False
+        return HTTPConnection(hostname, port, timeout=self.timeout), False
+
+    def _discard(self, host: Host) -> None:
+        """Close all idle connections to the host."""
+        with self._lock:
+            connections = self._idle.pop(host, [])
+        for connection in connections:
+            connection.close()
+
+    def _release(self, host: Host, connection: HTTPConnection, response: HTTPResponse) -> None:
+        if response.isclosed() and not response.will_close:
+            with self._lock:
+                idle = self._idle.setdefault(host, [])
+                if len(idle) < MAX_IDLE:
+                    idle.append(connection)
+                    return
+        connection.close()
+
+    def _send(self, url: str, headers: Dict[str, str]) -> Tuple[Host, HTTPConnection, HTTPResponse]:
+        parts = urlsplit(url)
+        host = (parts.scheme, parts.hostname or "", parts.port)
+        target = parts.path + ("?" + parts.query if parts.query else "")
+        error = ""
+        attempt = 0
+        while attempt <= self.retries:
+            connection, reused = self._acquire(host)
+            try:
+                connection.request("GET", target, headers=dict(headers, **{"User-Agent": "portcran"}))
+                response = connection.getresponse()
+            except (OSError, HTTPException) as ex:
+                connection.close()
+                if reused and isinstance(ex, STALE_ERRORS):
+                    # The server closed the idle connection (and likely the others), so retry at once on a new one
+                    self._discard(host)
+                    continue
+                error = str(ex) or type(ex).__name__
+            else:
+                if response.status < 500 or attempt == self.retries:
+                    return host, connection, response
+                error = "%d %s" % (response.status, response.reason)
+                response.read()
+                self._release(host, connection, response)
+            attempt += 1
+            if attempt <= self.retries:
+                sleep(self.backoff * 2 ** (attempt - 1))
+        raise PortError("HTTP: unable to fetch %s: %s" % (url, error))
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+    @contextmanager
+    def request(self, url: str, headers: Optional[Dict[str, str]] = None) -> Iterator[Response]:
+        """
+        Send a GET request for the specified URL, following redirects, and yield the response.
+
+        The connection is returned to the pool when the context exits if the response body was read completely,
+        otherwise the connection is closed.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            if urlsplit(url).scheme not in ("http", "https"):
+                try:
+                    stream = urlopen(url, timeout=self.timeout)
+                except URLError as ex:
+                    if not isinstance(ex.reason, FileNotFoundError):
+                        raise PortError("HTTP: unable to fetch %s: %s" % (url, ex.reason)) from ex
+                    # Report a missing file as HTTP would, i.e. so the Archive is tried for old versions
+                    yield Response(404, {}, BytesIO())
+                    return
+                with stream:
+                    yield Response(200, stream.headers, stream)
+                return
+            host, connection, response = self._send(url, headers or {})
+            if response.status in REDIRECTS and response.getheader("Location"):
+                response.read()
+                self._release(host, connection, response)
+                url = urljoin(url, response.getheader("Location"))
+                continue
+            try:
+                yield Response(response.status, response.headers, response)
+            finally:
+                self._release(host, connection, response)
+            return
+        raise PortError("HTTP: too many redirects fetching %s" % url)
@@ -1,11 +1,15 @@
 """The CranPort class that understands the CRAN package format."""
+from io import BytesIO
 from pathlib import Path
 from re import compile as re_compile
 from tarfile import TarFile
 from traceback import print_exc
-from typing import Callable, Dict, Optional, Union, cast
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union, cast
+from .metadata import CranMetadata, Description
 from .uses import Cran
-from ..core import Port, PortDepends, PortError, PortStub, Ports
+from ..core import Dependency, Port, PortDepends, PortError, PortStub, Ports
+from ..core.distinfo import checksum
+from ..core.make import MakeError, make_vars
 from ..dependency import PortDependency
 from ..utilities import Stream
 
@@ -96,50 +100,68 @@ DATE = (
 
 EMPTY_LINE = re_compile(r"^\* (?:R|man|src)/[^:]*:$")
 
-VERSION_IDENTIFIER = [
-    re_compile(r"^\* DESCRIPTION(?: \(Version\))?: (?:New version is|Version) (.+)\.$"),
-    re_compile(r"^Changes to Version (.+)$"),
-    re_compile(r"^Initial Version (.+)$"),
-    re_compile(r"^Version (.+)$"),
-]
+# Alternatives are tried in order, each capturing the version in its only group
+VERSION_IDENTIFIER = re_compile("|".join((
+    r"^\* DESCRIPTION(?: \(Version\))?: (?:New version is|Version) (.+)\.$",
+    r"^Changes to Version (.+)$",
+    r"^Initial Version (.+)$",
+    r"^Version (.+)$",
+)))
 
 LINE = ("* ", "( ", "o ")
 
-SECTION = [
-    re_compile(r"^{date},? .* <.*>$".format(date=DATE)),
-    re_compile(r"^\d{4}-\d{2}-\d{2}  .+$")
-]
+SECTION = re_compile("|".join((
+    r"^{date},? .* <.*>$".format(date=DATE),
+    r"^\d{4}-\d{2}-\d{2}  .+$",
+)))
+
+# Number of (newest) version sections parsed from a CRAN package's changelog
+CHANGELOG_LIMIT = 2
 
 DEPENDENCY = re_compile(r"([\w.]+)(?:\s*\((.*)\))?")
 
 ParseSignature = Callable[[str, str, int], None]
 
+Members = Dict[str, bytes]
 
-def extractfile(tar_file: TarFile, name: str, filtr: Callable[[str], str], line: int = 1) -> Optional[Stream]:
-    """Extract the specified file from a tarball using the specifeid filter and an optional line offset."""
-    try:
-        stream = tar_file.extractfile(name)
-    except KeyError:
+
+def extractfile(members: Members, name: str, filtr: Callable[[str], str], line: int = 1) -> Optional[Stream]:
+    """Extract the specified file from the tarball members using the specifeid filter and an optional line offset."""
+    if name not in members:
         return None
-    return None if stream is None else Stream((line.decode('utf-8') for line in stream.readlines()), filtr, line)
+    return Stream((line.decode('utf-8') for line in BytesIO(members[name]).readlines()), filtr, line)
+
+
+def read_members(distfile: Path, top: str, *groups: Sequence[str]) -> Members:
+    """
+    Read the specified files, from the top level directory, of a tarball in a single streaming pass.
+
+    Each group of file names lists alternative files in order of preference.  The tarball is only decompressed until
+    the most preferred file of every group has been found.
+    """
+    wanted = {"%s/%s" % (top, i) for group in groups for i in group}
+    preferred = ["%s/%s" % (top, group[0]) for group in groups]
+    members: Members = {}
+    with TarFile.open(str(distfile), "r|gz") as tar_file:
+        for member in tar_file:
+            if member.name in wanted and member.isfile():
+                stream = tar_file.extractfile(member)
+                assert stream is not None
+                members[member.name] = stream.read()
+                if all(i in members for i in preferred):
+                    break
+    return members
 
 
 def version_identifier(line: str) -> Optional[str]:
     """Try extract a version string from the specified line."""
-    for regex in VERSION_IDENTIFIER:
-        match = regex.match(line)
-        if match:
-            return match.group(1)
-    return None
+    match = VERSION_IDENTIFIER.match(line)
+    return None if match is None else match.group(cast(int, match.lastindex))
 
 
 def section(line: str) -> bool:
     """Determine if the specified line is a section break."""
-    for regex in SECTION:
-        match = regex.match(line)
-        if match:
-            return True
-    return False
+    return SECTION.match(line) is not None
 
 
 class CranPort(Port):
@@ -180,12 +202,12 @@ class CranPort(Port):
 
     _parse = Keywords()
 
-    def __init__(self, category: str, name: str, portdir: Optional[Path], distfile: Optional[TarFile] = None) -> None:
+    def __init__(self, category: str, name: str, portdir: Optional[Path], distfile: Optional[Path] = None) -> None:
         """
         Initialise a new instance of the CranPort class.
 
         The port's category and name must be specified.  Optionally the full path to the port directory and the source
-        package TarFile may be specified.
+        package tarball (distfile) may be specified.
         """
         super().__init__(category, Cran.PKGNAMEPREFIX + name, portdir)
         self.portname = name
@@ -193,8 +215,7 @@ class CranPort(Port):
             self.distname = "${PORTNAME}_${DISTVERSION}"
             self.uses[Cran].add("auto-plist")
             self.website = "https://CRAN.R-project.org/package=%s" % self.portname
-            self._load_descr(distfile)
-            self._load_changelog(distfile)
+            self._load_distfile(distfile)
 
     @staticmethod
     def _add_dependency(depends: PortDepends.Collection, value: str, optional: bool = False) -> None:
@@ -206,15 +227,18 @@ class CranPort(Port):
             name = depend.group(1).strip()
             if name not in INTERNAL_PACKAGES:
                 try:
-                    port = Ports.get_port_by_name(Cran.PKGNAMEPREFIX + name)
+                    port = Ports.find_port_by_name(Cran.PKGNAMEPREFIX + name)
                 except PortError:
+                    port = None
+                if port is None:
                     if not optional:
                         missing.append(name)
                     else:
                         suggested.append(name)
                 else:
+                    # The PKGNAME of a CRAN port is its name, so the port need not be loaded
                     condition = ">0" if not depend.group(2) else depend.group(2).replace("-", ".").replace(" ", "")
-                    depends.add(PortDependency(port.pkgname, condition, port.origin))
+                    depends.add(Dependency.intern(PortDependency(port.name, condition, port.origin)))
         if suggested:
             print("Suggested package(s) does not exist: %s" % ", ".join(suggested))
         if missing:
@@ -238,6 +262,11 @@ class CranPort(Port):
             return port
         return None
 
+    @property
+    def distfiles(self) -> Optional[List[Path]]:
+        """Path to the CRAN source package, as named by the DISTNAME used for CRAN ports."""
+        return [Ports.distdir / ("%s_%s.tar.gz" % (self.portname, self.version))]
+
     def _gen_plist(self) -> None:
         pkg_plist = self.portdir / "pkg-plist"
         if pkg_plist.exists():
@@ -306,7 +335,8 @@ class CranPort(Port):
     def _parse(self, value: str):
         self._add_dependency(self.depends.build, value)
 
-    def _load_changelog(self, distfile: TarFile) -> None:
+    def _load_changelog(self, distfile: Members, limit: Optional[int] = None) -> None:
+        """Parse the changelog, stopping before the specified number of (newest) version sections is exceeded."""
         for name in ("ChangeLog", "NEWS"):
             changelog = extractfile(distfile, "%s/%s" % (self.portname, name), lambda x: x.strip(), line=0)
             if changelog is not None:
@@ -334,28 +364,70 @@ class CranPort(Port):
                     else:
                         self.changelog[version][-1] += prev_line + " " + line
                         prev_line = ""
+            if limit is not None and len(self.changelog) >= limit:
+                break
             try:
                 version = cast(str, version_identifier(next(changelog)))
                 prev_line = ""
             except StopIteration:
                 break
 
-    def _load_descr(self, distfile: TarFile) -> None:
-        desc = extractfile(distfile, "%s/DESCRIPTION" % self.portname, lambda x: x.rstrip('\n'))
-        if desc is None:
-            raise NameError("CRAN '%s' package missing DESCRIPTION file")
-        identifier = re_compile(r"^[a-zA-Z/@]+:")
+    def _load_descr(self, description: Description) -> None:
         errors = []
-        for line in desc:
+        for key, value, line in description:
             try:
-                key, value = line.split(":", 1)
-                lines = [value.strip()] + [i.strip() for i in desc.take_while(lambda l: not identifier.match(l))]
-                self._parse(key, " ".join(i for i in lines if i), desc.line)  # type: ignore
+                self._parse(key, value, line)  # type: ignore
             except PortError as ex:
                 errors.append(ex)
         if errors:
             raise PortError("\n".join(e.args[0] for e in errors))
 
+    def _load_distfile(self, distfile: Path) -> None:
+        """Load the DESCRIPTION and changelog from the source package, or from the metadata cached for it."""
+        assert self.portname is not None
+        digest = checksum(distfile)[0]
+        metadata = CranMetadata.lookup(self.portname, digest)
+        if metadata is not None:
+            self._load_descr(metadata.description)
+            self.changelog.update(metadata.changelog)
+            return
+        members = read_members(distfile, self.portname, ("DESCRIPTION",), ("ChangeLog", "NEWS"))
+        description = self._read_descr(members)
+        self._load_descr(description)
+        self._load_changelog(members, CHANGELOG_LIMIT)
+        CranMetadata(self.version, description, self.changelog).save(self.portname, digest)
+
+    def _read_descr(self, distfile: Members) -> Description:
+        """Read the (key, value, line) entries from the CRAN's DESCRIPTION file."""
+        desc = extractfile(distfile, "%s/DESCRIPTION" % self.portname, lambda x: x.rstrip('\n'))
+        if desc is None:
+            raise NameError("CRAN '%s' package missing DESCRIPTION file")
+        identifier = re_compile(r"^[a-zA-Z/@]+:")
+        description = []
+        for line in desc:
+            key, value = line.split(":", 1)
+            lines = [value.strip()] + [i.strip() for i in desc.take_while(lambda l: not identifier.match(l))]
+            description.append((key, " ".join(i for i in lines if i), desc.line))
+        return description
+
+    @staticmethod
+    def read_version(port: PortStub) -> Tuple[str, str]:
+        """
+        Read only the CRAN package name and version of a port from its Makefile, without loading the port.
+
+        A PortError is raised if the Makefile cannot be read or does not itself define the name and version (i.e. a
+        slave port using MASTERDIR).
+        """
+        try:
+            variables = make_vars(port.portdir, ("PORTNAME", "DISTVERSION", "PORTVERSION"))
+        except (OSError, MakeError) as ex:
+            raise PortError("CRAN: unable to read Makefile of %s: %s" % (port.origin, ex)) from ex
+        portname = variables.pop_value("PORTNAME", default=None)
+        version = variables.pop_value("DISTVERSION", default=None) or variables.pop_value("PORTVERSION", default=None)
+        if portname is None or version is None:
+            raise PortError("CRAN: Makefile of %s does not define the port name and version" % port.origin)
+        return portname, version
+
     @staticmethod
     def create(name: str, distfile: Path, portdir: Optional[Path] = None) -> "CranPort":
         """
@@ -371,7 +443,7 @@ class CranPort(Port):
             categories = port.categories
         except PortError:
             pass
-        cran = CranPort(categories[0], name, portdir, TarFile.open(str(distfile), "r:gz"))
+        cran = CranPort(categories[0], name, portdir, distfile)
         cran.categories = categories
         if port is not None:
             cran.maintainer = cast(str, port.maintainer)
@@ -1,11 +1,12 @@
-from re import match
-from typing import Optional
+from typing import Match
 from .core import Dependency
 
 __all__ = ["LibDependency", "LocalBaseDependency", "PortDependency"]
 
 
 class LibDependency(Dependency):
+    __slots__ = ("libname",)
+
     def __init__(self, libname: str, origin: str) -> None:
         super().__init__(origin)
         self.libname = libname
@@ -14,15 +15,14 @@ class LibDependency(Dependency):
         return "lib%s.so:%s" % (self.libname, self.origin)
 
     @staticmethod
-    @Dependency.factory
-    def _create(target: str, origin: str) -> Optional["LibDependency"]:
-        condition = match(r"lib(.*).so", target)
-        if condition is not None:
-            return LibDependency(condition.group(1), origin)
-        return None
+    @Dependency.factory(r"lib(.*).so")
+    def _create(target: Match[str], origin: str) -> "LibDependency":
+        return LibDependency(target.group(1), origin)
 
 
 class LocalBaseDependency(Dependency):
+    __slots__ = ("path",)
+
     def __init__(self, path: str, origin: str) -> None:
         super().__init__(origin)
         self.path = path
@@ -31,15 +31,14 @@ class LocalBaseDependency(Dependency):
         return "${LOCALBASE}/%s:%s" % (self.path, self.origin)
 
     @staticmethod
-    @Dependency.factory
-    def _create(target: str, origin: str) -> Optional["LocalBaseDependency"]:
-        condition = match(r"\${LOCALBASE}/(.*)", target)
-        if condition is not None:
-            return LocalBaseDependency(condition.group(1), origin)
-        return None
+    @Dependency.factory(r"\${LOCALBASE}/(.*)")
+    def _create(target: Match[str], origin: str) -> "LocalBaseDependency":
+        return LocalBaseDependency(target.group(1), origin)
 
 
 class PortDependency(Dependency):
+    __slots__ = ("condition", "pkgname")
+
     def __init__(self, pkgname: str, condition: str, origin: str) -> None:
         super().__init__(origin)
         self.pkgname = pkgname
@@ -49,9 +48,6 @@ class PortDependency(Dependency):
         return "%s%s:%s" % (self.pkgname, self.condition, self.origin)
 
     @staticmethod
-    @Dependency.factory
-    def _create(target: str, origin: str) -> Optional["PortDependency"]:
-        condition = match(r"(.*)((?:>=|>).*)", target)
-        if condition is not None:
-            return PortDependency(condition.group(1), condition.group(2), origin)
-        return None
+    @Dependency.factory(r"(.*)((?:>=|>).*)")
+    def _create(target: Match[str], origin: str) -> "PortDependency":
+        return PortDependency(target.group(1), target.group(2), origin)
@@ -1,21 +1,44 @@
 from abc import ABCMeta, abstractproperty
-from typing import Any, Callable, Iterable, Iterator
+from os import environ
+from typing import Any, Callable, Generic, Iterable, Iterator, Optional, TypeVar
 
-__all__ = ["Orderable", "Stream"]
+__all__ = ["LazyAttribute", "Orderable", "Stream", "env_flag"]
+
+T = TypeVar("T")  # pylint: disable=C0103
+
+
+class LazyAttribute(Generic[T]):
+    # pylint: disable=too-few-public-methods
+    """A class attribute that is computed on first access and then replaced by its value."""
+
+    def __init__(self, factory: Callable[[], T]) -> None:
+        self._factory = factory
+        self._name: Optional[str] = None
+
+    def __get__(self, instance: Any, owner: type) -> T:
+        assert self._name is not None
+        value = self._factory()
+        setattr(owner, self._name, value)
+        return value
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self._name = name
 
 
 class Orderable(object, metaclass=ABCMeta):
     # pylint: disable=too-few-public-methods
+    __slots__ = ()
+
     def __eq__(self, other: object) -> bool:
         assert isinstance(other, Orderable)
-        return bool(self._key() == other._key)  # pylint: disable=W0212
+        return bool(self._key == other._key)  # pylint: disable=W0212
 
     def __hash__(self) -> int:
         return hash(self._key)
 
     def __lt__(self, other: object) -> bool:
         assert isinstance(other, Orderable)
-        return bool(self._key() < other._key)  # pylint: disable=W0212
+        return bool(self._key < other._key)  # pylint: disable=W0212
 
     def __ne__(self, other: object) -> bool:
         """Determine if this object is not equal to the specified object."""
@@ -50,3 +73,8 @@ class Stream(Iterator[str]):
             yield value
             if inclusive and not condition(value):
                 break
+
+
+def env_flag(name: str) -> bool:
+    """Return if the specified environment variable is set to "yes" (or "1" or "true"), ignoring case."""
+    return environ.get(name, default="no").lower() in ("1", "yes", "true")